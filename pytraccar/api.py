@@ -1,6 +1,43 @@
+import binascii
+import hashlib
+import hmac
+import os
+import threading
+import time
 import requests
-import json
-from pytraccar.pytraccar.exceptions import (
+try:
+    from urllib.parse import urlencode
+except ImportError:  # Python 2
+    from urllib import urlencode
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+# Use the fastest JSON codec available: orjson, then ujson, then the stdlib.
+# _dumps returns bytes and _loads takes bytes in all three cases.
+try:
+    import orjson
+    _dumps = orjson.dumps
+    _loads = orjson.loads
+except ImportError:
+    try:
+        import ujson
+
+        def _dumps(obj):
+            return ujson.dumps(obj).encode('utf-8')
+
+        _loads = ujson.loads
+    except ImportError:
+        import json
+
+        def _dumps(obj):
+            return json.dumps(obj).encode('utf-8')
+
+        def _loads(content):
+            return json.loads(content.decode('utf-8'))
+try:
+    import ijson  # Optional, only needed by the iter_* streaming methods
+except ImportError:
+    ijson = None
+from pytraccar.exceptions import (
     TraccarApiException,
     BadRequestException,
     ObjectNotFoundException,
@@ -8,42 +45,408 @@ from pytraccar.pytraccar.exceptions import (
     InvalidTokenException,
     UserPermissionException
 )
+
+_JSON_HEADERS = {'Content-Type': 'application/json'}
+_JSON_REPORT_HEADERS = {'Accept': 'application/json', 'Content-Type': 'application/json'}
+# Cookie cache files are never opened through a symlink. Not on Windows.
+_O_NOFOLLOW = getattr(os, 'O_NOFOLLOW', 0)
+
+# Status code to exception factory tables shared by the endpoints, see
+# _handle. Factories get the response so its text is only decoded on errors.
+_LOGIN_ERRORS = {401: lambda req: ForbiddenAccessException()}
+_TOKEN_ERRORS = {404: lambda req: InvalidTokenException()}
+_PERMISSION_ERRORS = {400: lambda req: UserPermissionException()}
+_BAD_REQUEST_ERRORS = {400: lambda req: BadRequestException(message=req.text)}
+
+
+def _handle(req, errors, ok=200):
+    """Checks the response status and returns its decoded body.
+
+    Args:
+        req: Response, with requests' status_code, content and text
+        errors: Status code to exception mapping. Values are called
+            with the response to build the exception to raise, so
+            nothing is built on the success path.
+        ok: Expected status code (Default value = 200)
+
+    Returns:
+        json: Decoded response body, None if it is empty
+
+    Raises:
+        TraccarApiException: Unexpected status code.
+    """
+    status = req.status_code
+    if status == ok:
+        content = req.content
+        return _loads(content) if content else None
+
+    exc = errors.get(status)
+    if exc is None:
+        raise TraccarApiException(info=req.text)
+    raise exc(req)
+
+
+def _with_query(path, data):
+    """Appends params to a URL, dropping None values like requests does.
+
+    Args:
+        path: Endpoint URL
+        data: Query params dict
+
+    Returns:
+        str: URL with its query string
+    """
+    return path + '?' + urlencode([(key, value) for key, value in data.items()
+                                   if value is not None], doseq=True)
+
+
+def _login_digest(salt, secret):
+    """Salted hash identifying a login in the cookie cache, so neither
+    passwords nor tokens are written to disk.
+    """
+    return hashlib.sha256(salt + secret.encode('utf-8')).hexdigest()
+
+
+def _api_urls(base_url):
+    """Builds the endpoint URLs of a Traccar server.
+
+    Args:
+        base_url: Your traccar server URL.
+
+    Returns:
+        dict: Endpoint name to URL
+    """
+    return {
+        'devices': base_url + '/api/devices',
+        'session': base_url + '/api/session',
+        'geofences': base_url + '/api/geofences',
+        'notifications': base_url + '/api/notifications',
+        'reports_events': base_url + '/api/reports/events',
+        'reports_route': base_url + '/api/reports/route',
+        'reports_trips': base_url + '/api/reports/trips',
+        'positions': base_url + '/api/positions',
+        'users': base_url + '/api/users',
+        'groups': base_url + '/api/groups',
+        'permissions': base_url + '/api/permissions',
+    }
+
+
+class _StreamedItems(object):
+    """Iterator over a streamed JSON array response.
+
+    The connection goes back to the pool once the array is read to the
+    end, or when close() is called, also as a context manager.
+    """
+
+    def __init__(self, req, items):
+        self._req = req
+        self._items = items
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._items)
+
+    next = __next__  # Python 2
+
+    def close(self):
+        self._items.close()
+        self._req.close()  # The generator never started if nothing was read
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
 class TraccarAPI:
     """Traccar v4.2 - https://www.traccar.org/api-reference/
     Abstraction for interacting with Traccar REST API.
 
     """
 
-    def __init__(self, base_url):
+    def __init__(self, base_url, cookie_cache=None, cookie_cache_ttl=1800, cache_updates=False):
         """
         Args:
             base_url: Your traccar server URL.
+            cookie_cache: File where the session cookies are kept between
+                runs, so logging in again skips the server round trip.
+                Disabled by default. (Default value = None)
+            cookie_cache_ttl: Seconds a cached session is reused.
+                (Default value = 1800)
+            cache_updates: Let update_device/update_geofence build the PUT
+                from the object returned by the previous update, instead of
+                fetching it first. Traccar replaces the whole object on PUT,
+                so changes made elsewhere since then to fields that are not
+                passed are overwritten. Only enable it when this client is
+                the only writer. (Default value = False)
 
         Examples:
             TraccarAPI('https://mytraccaserver.com'),
-            TraccarAPI('http://1.2.3.4')
+            TraccarAPI('http://1.2.3.4'),
+            TraccarAPI('http://1.2.3.4', cookie_cache='~/.pytraccar_session')
         """
         self._token = ''
-        self._urls = {
-            'devices': base_url + '/api/devices',
-            'session': base_url + '/api/session',
-            'geofences': base_url + '/api/geofences',
-            'notifications': base_url + '/api/notifications',
-            'reports_events': base_url + '/api/reports/events',
-            'reports_route': base_url + '/api/reports/route',
-            'reports_trips': base_url + '/api/reports/trips',
-            'positions': base_url + '/api/positions',
-            'users': base_url + '/api/users',
-            'groups': base_url + '/api/groups',
-            'permissions': base_url + '/api/permissions',
+        self._urls = _api_urls(base_url)
+        self._devices_prefix = self._urls['devices'] + '/'
+        self._geofences_prefix = self._urls['geofences'] + '/'
+        # Last known server representation per str(id), used by update_* to
+        # skip fetching current values before every PUT. See cache_updates.
+        self._cache_updates = cache_updates
+        self._device_cache = {}
+        self._geofence_cache = {}
+        # Last ETag and raw body per URL, to revalidate "fetch all" calls
+        self._etags = {}
+        self._resp_cache = {}
+
+        # Session persisted by a previous run, reused by login_with_* when
+        # it belongs to the same login. A 401 then triggers one re-login.
+        self._cookie_cache = cookie_cache and os.path.expanduser(cookie_cache)
+        self._cookie_cache_ttl = cookie_cache_ttl
+        self._cached_login = self._load_cookie_cache()
+        self._login_key = None
+        self._relogin = None
+        self._relogin_lock = threading.Lock()
+
+        self._session = self._new_session()
+
+    def _new_session(self):
+        """Creates the HTTP session used by all the endpoints.
+
+        Returns:
+            requests.Session
+        """
+        session = requests.Session()
+
+        # Keep connections alive and reuse them across calls, retrying
+        # transient gateway errors. raise_on_status=False hands the last
+        # response back so it is reported as a TraccarApiException.
+        adapter = HTTPAdapter(pool_connections=32, pool_maxsize=32,
+                              max_retries=Retry(total=3, backoff_factor=0.1,
+                                                status_forcelist=(502, 503, 504),
+                                                raise_on_status=False))
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.headers['Connection'] = 'keep-alive'
+        if self._cookie_cache:
+            session.hooks['response'].append(self._retry_unauthorized)
+
+        # "Fetch all" requests never change, prepare them once. Cookies are
+        # added on each send, see _send_prepared.
+        self._prepared_all = {
+            name: session.prepare_request(
+                requests.Request('GET', self._urls[name], params={'all': True}))
+            for name in ('devices', 'geofences', 'notifications', 'users')
         }
-        self._session = requests.Session()
+        return session
 
     @property
     def token(self):
         """ """
         return self._token
 
+    def _send_prepared(self, prepared, headers=None):
+        """Sends a copy of a prepared request with the current session cookies.
+
+        Args:
+            prepared: requests.PreparedRequest built from this session
+            headers: Extra headers for this send only (Default value = None)
+
+        Returns:
+            requests.Response
+        """
+        prep = prepared.copy()
+        if headers:
+            prep.headers.update(headers)
+        prep.prepare_cookies(self._session.cookies)
+        # Session.request would also apply verify/cert/proxies and their
+        # environment variables (REQUESTS_CA_BUNDLE, ...), send() does not
+        settings = self._session.merge_environment_settings(prep.url, {}, None, None, None)
+        return self._session.send(prep, **settings)
+
+    def _send_all(self, name, headers=None):
+        """Sends the "fetch all" request of an endpoint.
+
+        Args:
+            name: Endpoint name, key of self._prepared_all
+            headers: Extra headers for this send only (Default value = None)
+
+        Returns:
+            requests.Response
+        """
+        return self._send_prepared(self._prepared_all[name], headers)
+
+    def _send_json(self, method, url, data):
+        """Sends data as a JSON request body.
+
+        Returns:
+            requests.Response
+        """
+        return self._session.request(method, url, data=_dumps(data), headers=_JSON_HEADERS)
+
+    def _stream(self, url, headers=None):
+        """Sends a GET whose body is read lazily, see _iter_items.
+
+        Returns:
+            requests.Response
+        """
+        return self._session.get(url=url, headers=headers, stream=True)
+
+    def _get_all(self, name):
+        """Sends a prepared "fetch all" request, revalidating with ETags.
+
+        When the server answered the last call with an ETag, it is sent
+        back as If-None-Match and a 304 reply decodes the cached body.
+
+        Args:
+            name: Endpoint name, key of self._urls
+
+        Returns:
+            json: Decoded response body
+
+        Raises:
+            UserPermissionException: User is not an admin or manager.
+        """
+        url = self._urls[name]
+        etag = self._etags.get(url)
+        req = self._send_all(name, {'If-None-Match': etag} if etag else None)
+
+        if req.status_code == 304 and url in self._resp_cache:
+            # Decode again so callers never share the same objects
+            return _loads(self._resp_cache[url])
+
+        result = self._handle(req, _PERMISSION_ERRORS)
+        etag = req.headers.get('ETag')
+        if etag:
+            self._etags[url] = etag
+            self._resp_cache[url] = req.content
+        else:
+            self._etags.pop(url, None)
+            self._resp_cache.pop(url, None)
+        return result
+
+    _handle = staticmethod(_handle)
+
+    @staticmethod
+    def _iter_items(req):
+        """Yields the elements of a streamed JSON array response one by one.
+
+        Args:
+            req: requests.Response opened with stream=True
+
+        Returns:
+            generator: Decoded array elements
+        """
+        try:
+            req.raw.decode_content = True  # Undo gzip/deflate encoding
+            for item in ijson.items(req.raw, 'item', use_float=True):
+                yield item
+        finally:
+            req.close()
+
+    def _load_cookie_cache(self):
+        """Reads the persisted session, if enabled and not expired.
+
+        Returns:
+            dict: 'kind', 'salt', 'digest', 'cookies' and 'session'
+                entries, or None
+        """
+        if not self._cookie_cache:
+            return None
+        try:
+            fd = os.open(self._cookie_cache, os.O_RDONLY | _O_NOFOLLOW)
+            with os.fdopen(fd, 'rb') as cache:
+                if time.time() - os.fstat(fd).st_mtime > self._cookie_cache_ttl:
+                    return None
+                cached = _loads(cache.read())
+            cached['salt'] = binascii.unhexlify(cached['salt'])
+            return cached
+        except Exception:  # Missing or unreadable cache, log in normally
+            return None
+
+    def _save_cookie_cache(self, session):
+        """Persists the session cookies and info of the current login.
+
+        Stored as JSON, with only the cookie fields requests needs to
+        send them back, so loading the file never runs code.
+
+        Args:
+            session: Session info returned by the server
+        """
+        if not self._cookie_cache:
+            return
+        kind, secret = self._login_key
+        salt = os.urandom(16)
+        cookies = [{'name': cookie.name, 'value': cookie.value, 'domain': cookie.domain,
+                    'path': cookie.path, 'expires': cookie.expires, 'secure': cookie.secure}
+                   for cookie in self._session.cookies]
+        try:
+            fd = os.open(self._cookie_cache,
+                         os.O_WRONLY | os.O_CREAT | os.O_TRUNC | _O_NOFOLLOW, 0o600)
+        except OSError:  # E.g. a symlink, the login works without the cache
+            return
+        with os.fdopen(fd, 'wb') as cache:
+            if hasattr(os, 'fchmod'):
+                os.fchmod(fd, 0o600)  # os.open keeps the mode of an existing file
+            cache.write(_dumps({'kind': kind,
+                                'salt': binascii.hexlify(salt).decode('ascii'),
+                                'digest': _login_digest(salt, secret),
+                                'cookies': cookies,
+                                'session': session}))
+
+    def _invalidate_cookie_cache(self):
+        self._cached_login = None
+        try:
+            os.remove(self._cookie_cache)
+        except OSError:
+            pass
+
+    def _restore_session(self, kind, secret):
+        """Restores the persisted cookies if they belong to this login.
+
+        Args:
+            kind: 'credentials' or 'token'
+            secret: What the login was made with, e.g. the token.
+                Only its salted hash is stored.
+
+        Returns:
+            json: Cached session info, None if there is none for this login
+        """
+        self._login_key = (kind, secret)
+        cached = self._cached_login
+        if (cached is None or cached.get('kind') != kind or not hmac.compare_digest(
+                cached.get('digest', ''), _login_digest(cached.get('salt', b''), secret))):
+            self._cached_login = None  # Another login's, this one starts fresh
+            return None
+        for cookie in cached['cookies']:
+            self._session.cookies.set_cookie(requests.cookies.create_cookie(**cookie))
+        return cached['session']
+
+    def _retry_unauthorized(self, resp, **kwargs):
+        """Response hook: on 401 with a restored session, log in again and
+        resend the request once.
+        """
+        if (resp.status_code != 401 or self._relogin is None
+                or resp.request.url.startswith(self._urls['session'])):
+            return resp
+
+        # Concurrent 401s (e.g. set_permissions_bulk) log in only once. A
+        # request sent before that re-login is just resent with new cookies.
+        prep = resp.request.copy()
+        sent = prep.headers.pop('Cookie', None)
+        with self._relogin_lock:
+            if sent == requests.cookies.get_cookie_header(self._session.cookies, prep):
+                if self._cached_login is None:
+                    return resp  # Not a restored session, or already renewed
+                self._invalidate_cookie_cache()
+                self._session.cookies.clear()
+                self._relogin()
+
+        prep.prepare_cookies(self._session.cookies)
+        return self._session.send(prep, **kwargs)
+
     """
     ----------------------
     /api/session 
@@ -65,16 +468,18 @@ class TraccarAPI:
             TraccarApiException:
 
         """
+        session = self._restore_session('credentials', username + '\n' + password)
+        self._relogin = lambda: self._new_session_with_credentials(username, password)
+        return session if session is not None else self._relogin()
+
+    def _new_session_with_credentials(self, username, password):
         path = self._urls['session']
         data = {'email': username, 'password': password}
         req = self._session.post(url=path, data=data)
 
-        if req.status_code == 200:
-            return req.json()
-        elif req.status_code == 401:
-            raise ForbiddenAccessException
-        else:
-            raise TraccarApiException(info=req.text)
+        session = self._handle(req, _LOGIN_ERRORS)
+        self._save_cookie_cache(session)
+        return session
 
     def login_with_token(self, token):
         """Path: /session
@@ -92,17 +497,22 @@ class TraccarAPI:
             TraccarApiException:
 
         """
+        session = self._restore_session('token', token)
+        self._relogin = lambda: self._new_session_with_token(token)
+        if session is None:
+            return self._relogin()
+        self._token = token
+        return session
+
+    def _new_session_with_token(self, token):
         path = self._urls['session']
         data = {'token': token}
         req = self._session.get(url=path, params=data)
 
-        if req.status_code == 200:
-            self._token = token  # Save valid token.
-            return req.json()
-        elif req.status_code == 404:
-            raise InvalidTokenException
-        else:
-            raise TraccarApiException(info=req.text)
+        session = self._handle(req, _TOKEN_ERRORS)
+        self._token = token  # Save valid token.
+        self._save_cookie_cache(session)
+        return session
 
     """
     ----------------------
@@ -119,16 +529,7 @@ class TraccarAPI:
           json: All users devices
 
         """
-        path = self._urls['devices']
-        data = {'all': True}
-        req = self._session.get(url=path, params=data)
-
-        if req.status_code == 200:
-            return req.json()
-        if req.status_code == 400:
-            raise UserPermissionException
-        else:
-            raise TraccarApiException(info=req.text)
+        return self._get_all('devices')
 
     def get_devices(self, query=None, params=None):
         """
@@ -156,12 +557,7 @@ class TraccarAPI:
             data = {query: params}
             req = self._session.get(url=path, params=data)
 
-        if req.status_code == 200:
-            return req.json()
-        elif req.status_code == 400:
-            raise ObjectNotFoundException(obj=params, obj_type='Device')
-        else:
-            raise TraccarApiException(info=req.text)
+        return self._handle(req, {400: lambda req: ObjectNotFoundException(obj=params, obj_type='Device')})
 
     def create_device(self, name, unique_id, group_id=0,
                       phone='', model='', contact='', category=None):
@@ -204,51 +600,56 @@ class TraccarAPI:
             "groupId": group_id,
         }
 
-        req = self._session.post(url=path, json=data)
+        req = self._send_json('POST', path, data)
 
-        if req.status_code == 200:
-            return req.json()
-        elif req.status_code == 400:
-            raise BadRequestException(message=req.text)
-        else:
-            raise TraccarApiException(info=req.text)
+        return self._handle(req, _BAD_REQUEST_ERRORS)
 
     def update_device(self, device_id, name=None, unique_id=None, group_id=None,
                       phone=None, model=None, contact=None, category=None):
 
-        # Get current device values
-        req = self.get_devices(query='id', params=device_id)
-        device_info = req[0]
-
-        update = {
-            'name': name,
-            'uniqueId': unique_id,
-            'phone': phone,
-            'model': model,
-            'contact': contact,
-            'category': category,
-            'groupId': group_id,
-        }
-
-        # Replaces all updated values in device_info
-        data = {key: value if update.get(key) is None else update[key] for key, value in device_info.items()}
-        headers = {'Content-Type': 'application/json'}
-
-        req = self._session.put('{}/{}'.format(self._urls['devices'], device_id),
-                                data=json.dumps(data), headers=headers)
-
-        if req.status_code == 200:
-            return req.json()
-        elif req.status_code == 400:
-            raise BadRequestException(message=req.text)
-        else:
-            raise TraccarApiException(info=req.text)
+        # Get current device values, from the cache if cache_updates is on
+        device_info = self._device_cache.get(str(device_id))
+        cached = device_info is not None
+        if not cached:
+            device_info = self.get_devices(query='id', params=device_id)[0]
+
+        # Replaces all updated values in a copy of device_info, so the
+        # cached entry is untouched if the update fails
+        data = dict(device_info)
+        if name is not None:
+            data['name'] = name
+        if unique_id is not None:
+            data['uniqueId'] = unique_id
+        if phone is not None:
+            data['phone'] = phone
+        if model is not None:
+            data['model'] = model
+        if contact is not None:
+            data['contact'] = contact
+        if category is not None:
+            data['category'] = category
+        if group_id is not None:
+            data['groupId'] = group_id
+
+        req = self._send_json('PUT', self._devices_prefix + str(device_id), data)
+
+        if cached and 400 < req.status_code < 500:
+            # Cached values may be stale, retry once with fresh ones
+            del self._device_cache[str(device_id)]
+            return self.update_device(device_id, name=name, unique_id=unique_id,
+                                      group_id=group_id, phone=phone, model=model,
+                                      contact=contact, category=category)
+
+        device_info = self._handle(req, _BAD_REQUEST_ERRORS)
+        if self._cache_updates:
+            self._device_cache[str(device_id)] = device_info
+        return device_info
 
     def delete_device(self, device_id):
-        req = self._session.delete('{}/{}'.format(self._urls['devices'], device_id))
+        self._device_cache.pop(str(device_id), None)
+        req = self._session.delete(self._devices_prefix + str(device_id))
 
-        if req.status_code != 204:
-            raise TraccarApiException(info=req.text)
+        self._handle(req, {}, ok=204)
 
     """
         ----------------------
@@ -266,16 +667,7 @@ class TraccarAPI:
           json: All geofences
 
         """
-        path = self._urls['geofences']
-        data = {'all': True}
-        req = self._session.get(url=path, params=data)
-
-        if req.status_code == 200:
-            return req.json()
-        if req.status_code == 400:
-            raise UserPermissionException
-        else:
-            raise TraccarApiException(info=req.text)
+        return self._get_all('geofences')
 
     def get_geofences(self, query=None, params=None):
         """
@@ -303,12 +695,7 @@ class TraccarAPI:
             data = {query: params}
             req = self._session.get(url=path, params=data)
 
-        if req.status_code == 200:
-            return req.json()
-        elif req.status_code == 400:
-            raise ObjectNotFoundException(obj=params, obj_type='Geofence')
-        else:
-            raise TraccarApiException(info=req.text)
+        return self._handle(req, {400: lambda req: ObjectNotFoundException(obj=params, obj_type='Geofence')})
 
     def create_geofence(self, name, area, description='', calendarId=None, attributes=None):
         """Path: /geofences
@@ -339,49 +726,66 @@ class TraccarAPI:
             "area": str(area),
         }
 
-        req = self._session.post(url=path, json=data)
+        req = self._send_json('POST', path, data)
 
-        if req.status_code == 200:
-            return req.json()
-        elif req.status_code == 400:
-            raise BadRequestException(message=req.text)
-        else:
-            raise TraccarApiException(info=req.text)
+        return self._handle(req, _BAD_REQUEST_ERRORS)
 
     def update_geofence(self, geofence_id, name=None, area=None, description=None,
                       calendarId=None, attributes=None):
+        """Path: /geofences/{id}
+        Update a geofence. Only the given params are changed.
 
-        # Get current geofence values
-        req = self.get_geofences(query='id', params=geofence_id)
-        geofence_info = req[0]
+        Args:
+          geofence_id: Geofence identifier.
+          area: The Geofence area in WKT representation
 
-        update = {
-            'name': name,
-            'area': area,
-            'description': description,
-            'calendarId': calendarId,
-            'attributes': attributes,
-        }
+        Returns:
+          json: Updated geofence.
 
-        # Replaces all updated values in geofence_info
-        data = {key: value if update.get(key) is None else update[key] for key, value in geofence_info.items()}
-        headers = {'Content-Type': 'application/json'}
+        Raises:
+          BadRequestException:
 
-        req = self._session.put('{}/{}'.format(self._urls['geofences'], geofence_id),
-                                data=json.dumps(data), headers=headers)
+        """
 
-        if req.status_code == 200:
-            return req.json()
-        elif req.status_code == 400:
-            raise BadRequestException(message=req.text)
-        else:
-            raise TraccarApiException(info=req.text)
+        # Get current geofence values, from the cache if cache_updates is on
+        geofence_info = self._geofence_cache.get(str(geofence_id))
+        cached = geofence_info is not None
+        if not cached:
+            geofence_info = self.get_geofences(query='id', params=geofence_id)[0]
+
+        # Replaces all updated values in a copy of geofence_info, so the
+        # cached entry is untouched if the update fails
+        data = dict(geofence_info)
+        if name is not None:
+            data['name'] = name
+        if area is not None:
+            data['area'] = str(area)
+        if description is not None:
+            data['description'] = description
+        if calendarId is not None:
+            data['calendarId'] = calendarId
+        if attributes is not None:
+            data['attributes'] = attributes
+
+        req = self._send_json('PUT', self._geofences_prefix + str(geofence_id), data)
+
+        if cached and 400 < req.status_code < 500:
+            # Cached values may be stale, retry once with fresh ones
+            del self._geofence_cache[str(geofence_id)]
+            return self.update_geofence(geofence_id, name=name, area=area,
+                                        description=description, calendarId=calendarId,
+                                        attributes=attributes)
+
+        geofence_info = self._handle(req, _BAD_REQUEST_ERRORS)
+        if self._cache_updates:
+            self._geofence_cache[str(geofence_id)] = geofence_info
+        return geofence_info
 
     def delete_geofence(self, geofence_id):
-        req = self._session.delete('{}/{}'.format(self._urls['geofences'], geofence_id))
+        self._geofence_cache.pop(str(geofence_id), None)
+        req = self._session.delete(self._geofences_prefix + str(geofence_id))
 
-        if req.status_code != 204:
-            raise TraccarApiException(info=req.text)
+        self._handle(req, {}, ok=204)
 
     """
     ----------------------
@@ -398,16 +802,7 @@ class TraccarAPI:
           json: list of Notifications
 
         """
-        path = self._urls['notifications']
-        data = {'all': True}
-        req = self._session.get(url=path, params=data)
-
-        if req.status_code == 200:
-            return req.json()
-        elif req.status_code == 400:
-            raise UserPermissionException
-        else:
-            raise TraccarApiException(info=req.text)
+        return self._get_all('notifications')
 
     """
     ----------------------
@@ -436,14 +831,9 @@ class TraccarAPI:
         if not groupId:
             data['groupId'] = "1"
 
-        req = self._session.get(url=path, params=data)
+        req = self._session.get(url=_with_query(path, data))
 
-        if req.status_code == 200:
-            return req.json()
-        if req.status_code == 400:
-            raise UserPermissionException
-        else:
-            raise TraccarApiException(info=req.text)
+        return self._handle(req, _PERMISSION_ERRORS)
 
     """
     ----------------------
@@ -466,11 +856,41 @@ class TraccarAPI:
 	        'to': endTime,
 	        'id': position_id,
         }
-        req = self._session.get(url=path, params=data)
+        req = self._session.get(url=_with_query(path, data))
+
+        return self._handle(req, _PERMISSION_ERRORS)
+
+    def iter_positions(self, deviceId=None, startTime=None, endTime=None, position_id=None):
+        """Path: /positions
+        Same as get_positions, but streams the response and yields
+        positions one at a time instead of loading the whole list.
+        Requires ijson.
+
+        The response holds a pooled connection until it is read to the
+        end: close the iterator, or use it in a with block, when stopping
+        early.
+
+        Args:
+
+        Returns:
+            iterator: Positions, with a close() method
+        """
+        if ijson is None:
+            raise ImportError('iter_positions requires ijson')
+
+        path = self._urls['positions']
+        data = {
+            'deviceId': deviceId,
+            'from': startTime,
+            'to': endTime,
+            'id': position_id,
+        }
+        req = self._stream(_with_query(path, data))
 
         if req.status_code == 200:
-            return req.json()
+            return _StreamedItems(req, self._iter_items(req))
         if req.status_code == 400:
+            req.close()
             raise UserPermissionException
         else:
             raise TraccarApiException(info=req.text)
@@ -498,16 +918,9 @@ class TraccarAPI:
         if not groupId:
             data['groupId'] = "1"
 
+        req = self._session.get(url=_with_query(path, data), headers=_JSON_REPORT_HEADERS)
 
-        headers = {'Accept': 'application/json','Content-Type': 'application/json'}
-        req = self._session.get(url=path, params=data, headers=headers)
-
-        if req.status_code == 200:
-            return req.json()
-        if req.status_code == 400:
-            raise UserPermissionException
-        else:
-            raise TraccarApiException(info=req.text)
+        return self._handle(req, _PERMISSION_ERRORS)
 
     """
     ----------------------
@@ -523,16 +936,7 @@ class TraccarAPI:
         Returns:
           json: All users
         """
-        path = self._urls['users']
-        data = {'all': True}
-        req = self._session.get(url=path, params=data)
-
-        if req.status_code == 200:
-            return req.json()
-        if req.status_code == 400:
-            raise UserPermissionException
-        else:
-            raise TraccarApiException(info=req.text)
+        return self._get_all('users')
     """
     ----------------------
     /api/users
@@ -570,14 +974,9 @@ class TraccarAPI:
             "attributes":{"speedUnit":"kmh"},
         }
 
-        req = self._session.post(url=path, json=data)
+        req = self._send_json('POST', path, data)
 
-        if req.status_code == 200:
-            return req.json()
-        elif req.status_code == 400:
-            raise BadRequestException(message=req.text)
-        else:
-            raise TraccarApiException(info=req.text)
+        return self._handle(req, _BAD_REQUEST_ERRORS)
     """
     ----------------------
     /api/permissions
@@ -585,35 +984,55 @@ class TraccarAPI:
     """
     def set_permissions(self, userId, deviceId=0, groupId=0):
         """Path: /permissions
-        Can only be used by admins to set positions
+        Can only be used by admins to set permissions
 
         Args:
+            userId: User identifier
+            deviceId: Device to link to the user (Default value = 0)
+            groupId: Group to link to the user, if no deviceId (Default value = 0)
 
         Returns:
             json: Permissions object
+
+        Raises:
+            ValueError: Neither deviceId nor groupId given.
         """
         path = self._urls['permissions']
-        
-        if deviceId !=0:
-            data = {
-	            "userId": userId,
-	            "deviceId": deviceId,
-            }
-        else:
-            if groupId != 0:
-                data = {
-	                "userId": userId,
-	                "groupId": groupId,
-                }
-        
-        req = self._session.post(url=path, json=data)
-
-        if req.status_code == 204:
-            return data
-        if req.status_code == 400:
-            raise BadRequestException(message=req.text)
+
+        if deviceId:
+            data = {"userId": userId, "deviceId": deviceId}
+        elif groupId:
+            data = {"userId": userId, "groupId": groupId}
         else:
-            raise TraccarApiException(info=req.text)
+            raise ValueError("deviceId or groupId required")
+
+        req = self._send_json('POST', path, data)
+
+        self._handle(req, _BAD_REQUEST_ERRORS, ok=204)
+        return data
+
+    def set_permissions_bulk(self, userId, deviceIds=None, groupIds=None):
+        """Path: /permissions
+        Links several devices and/or groups to a user, issuing the
+        set_permissions calls concurrently over the connection pool.
+
+        Args:
+            userId: User identifier
+            deviceIds: Devices identifiers list (Default value = None)
+            groupIds: Groups identifiers list (Default value = None)
+
+        Returns:
+            list: Permissions objects, devices first then groups
+        """
+        calls = [{'deviceId': device_id} for device_id in deviceIds or ()]
+        calls += [{'groupId': group_id} for group_id in groupIds or ()]
+
+        # Imported here so the module still loads on Python 2 without futures
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            futures = [executor.submit(self.set_permissions, userId, **call) for call in calls]
+            return [future.result() for future in futures]
 
     """
     ----------------------
@@ -636,14 +1055,9 @@ class TraccarAPI:
 	        'userId': userId,
         }
 
-        req = self._session.get(url=path, params=data)
+        req = self._session.get(url=_with_query(path, data))
 
-        if req.status_code == 200:
-            return req.json()
-        if req.status_code == 400:
-            raise UserPermissionException
-        else:
-            raise TraccarApiException(info=req.text)
+        return self._handle(req, _PERMISSION_ERRORS)
 
     """
     ----------------------
@@ -666,12 +1080,41 @@ class TraccarAPI:
 	        'to': endTime,
         }
 
-        headers = {'Accept': 'application/json','Content-Type': 'application/json'}
-        req = self._session.get(url=path, params=data, headers=headers)
+        req = self._session.get(url=_with_query(path, data), headers=_JSON_REPORT_HEADERS)
+
+        return self._handle(req, _PERMISSION_ERRORS)
+
+    def iter_route(self, deviceid, startTime, endTime):
+        """Path: /route
+        Same as get_route, but streams the response and yields
+        positions one at a time instead of loading the whole list.
+        Requires ijson.
+
+        The response holds a pooled connection until it is read to the
+        end: close the iterator, or use it in a with block, when stopping
+        early.
+
+        Args:
+
+        Returns:
+            iterator: Positions, with a close() method
+        """
+        if ijson is None:
+            raise ImportError('iter_route requires ijson')
+
+        path = self._urls['reports_route']
+        data = {
+            'deviceId': deviceid,
+            'from': startTime,
+            'to': endTime,
+        }
+
+        req = self._stream(_with_query(path, data), headers=_JSON_REPORT_HEADERS)
 
         if req.status_code == 200:
-            return req.json()
+            return _StreamedItems(req, self._iter_items(req))
         if req.status_code == 400:
+            req.close()
             raise UserPermissionException
         else:
             raise TraccarApiException(info=req.text)
@@ -0,0 +1,648 @@
+import asyncio
+
+import aiohttp
+
+from pytraccar.api import (
+    _api_urls,
+    _dumps,
+    _handle,
+    _JSON_HEADERS,
+    _JSON_REPORT_HEADERS,
+    _BAD_REQUEST_ERRORS,
+    _LOGIN_ERRORS,
+    _PERMISSION_ERRORS,
+    _TOKEN_ERRORS
+)
+from pytraccar.exceptions import ObjectNotFoundException
+
+
+def _query(data):
+    """Converts a params dict into the query list aiohttp accepts.
+
+    None values are dropped and lists become repeated keys, as requests
+    does. Booleans, which aiohttp rejects, are sent as 'true'/'false'.
+
+    Args:
+        data: Query params dict
+
+    Returns:
+        list: (key, value) pairs
+    """
+    query = []
+    for key, value in data.items():
+        if value is None:
+            continue
+        for item in value if isinstance(value, (list, tuple)) else (value,):
+            if isinstance(item, bool):
+                item = 'true' if item else 'false'
+            query.append((key, item))
+    return query
+
+
+class _Reply(object):
+    """Status and body of a read aiohttp response, with the attribute
+    names of requests.Response so the api._handle tables apply.
+    """
+
+    def __init__(self, status_code, content):
+        self.status_code = status_code
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', 'replace')
+
+
+class AsyncTraccarAPI:
+    """Traccar v4.2 - https://www.traccar.org/api-reference/
+    Asynchronous abstraction for interacting with Traccar REST API.
+
+    Mirrors TraccarAPI so per-device calls can be issued concurrently,
+    e.g. with asyncio.gather, over a shared keep-alive connection pool.
+
+    """
+
+    def __init__(self, base_url):
+        """
+        Args:
+            base_url: Your traccar server URL.
+
+        Examples:
+            async with AsyncTraccarAPI('https://mytraccaserver.com') as api:
+                await api.login_with_token(token)
+                positions = await api.get_positions_bulk([1, 2, 3], start, end)
+        """
+        self._token = ''
+        self._urls = _api_urls(base_url)
+        self._devices_prefix = self._urls['devices'] + '/'
+        self._geofences_prefix = self._urls['geofences'] + '/'
+        self._session = None
+
+    @property
+    def token(self):
+        """ """
+        return self._token
+
+    async def __aenter__(self):
+        self._get_session()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def _get_session(self):
+        # The session is created lazily so it binds to the running loop.
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=64, keepalive_timeout=75)
+            # unsafe=True keeps the session cookie of servers given by IP
+            self._session = aiohttp.ClientSession(connector=connector,
+                                                  cookie_jar=aiohttp.CookieJar(unsafe=True))
+        return self._session
+
+    async def close(self):
+        """Closes the underlying connection pool."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _request(self, method, url, **kwargs):
+        """Issues a request and reads its whole body.
+
+        Returns:
+            _Reply: Status code and body, see api._handle
+        """
+        async with self._get_session().request(method, url, **kwargs) as resp:
+            return _Reply(resp.status, await resp.read())
+
+    _handle = staticmethod(_handle)
+
+    async def _send_json(self, method, url, data):
+        """Sends data as a JSON request body, encoded like TraccarAPI does.
+
+        Returns:
+            _Reply: Status code and body, see api._handle
+        """
+        return await self._request(method, url, data=_dumps(data), headers=_JSON_HEADERS)
+
+    """
+    ----------------------
+    /api/session
+    ----------------------
+    """
+    async def login_with_credentials(self, username, password):
+        """Path: /session
+        Creates a new session with user's credentials.
+
+        Args:
+            username: User email
+            password: User password
+
+        Returns:
+            json: Session info
+
+        Raises:
+            ForbiddenAccessException: Wrong username or password.
+            TraccarApiException:
+
+        """
+        path = self._urls['session']
+        data = {'email': username, 'password': password}
+        req = await self._request('POST', path, data=data)
+
+        return self._handle(req, _LOGIN_ERRORS)
+
+    async def login_with_token(self, token):
+        """Path: /session
+        Creates a new session by using the provided token.
+
+        Args:
+          token: User session token.
+                 This token can be generated on the web interface.
+
+        Returns:
+          json: Session info
+
+        Raises:
+            InvalidTokenException:
+            TraccarApiException:
+
+        """
+        path = self._urls['session']
+        data = {'token': token}
+        req = await self._request('GET', path, params=_query(data))
+
+        session = self._handle(req, _TOKEN_ERRORS)
+        self._token = token  # Save valid token.
+        return session
+
+    """
+    ----------------------
+    /api/devices
+    ----------------------
+    """
+    async def get_all_devices(self):
+        """Path: /devices
+        Can only be used by admins or managers to fetch all entities.
+
+        Returns:
+          json: All users devices
+
+        """
+        path = self._urls['devices']
+        data = {'all': True}
+        req = await self._request('GET', path, params=_query(data))
+
+        return self._handle(req, _PERMISSION_ERRORS)
+
+    async def get_devices(self, query=None, params=None):
+        """
+        Path: /devices
+        Fetch a list of devices.
+        Without any params, returns a list of the user's devices.
+
+        Args:
+          query: Fetch by: userId, id or uniqueId (Default value = None)
+          params: identifier or identifiers list.
+            Examples: [5, 10], 'myDeviceID' (Default value = None)
+
+        Returns:
+          json: Device list
+
+        Raises:
+          ObjectNotFoundException:
+
+        """
+        path = self._urls['devices']
+
+        if not query:
+            req = await self._request('GET', path)
+        else:
+            data = {query: params}
+            req = await self._request('GET', path, params=_query(data))
+
+        return self._handle(req, {400: lambda req: ObjectNotFoundException(obj=params, obj_type='Device')})
+
+    async def create_device(self, name, unique_id, group_id=0,
+                            phone='', model='', contact='', category=None):
+        """Path: /devices
+        Create a device. Only requires name and unique ID.
+        Other params are optional, see TraccarAPI.create_device.
+
+        Returns:
+          json: Created device.
+
+        Raises:
+          BadRequestException: If device exists in database.
+
+        """
+        path = self._urls['devices']
+
+        data = {
+            "id": -1,  # id auto-assignment
+            "name": name,
+            "uniqueId": unique_id,
+            "phone": phone,
+            "model": model,
+            "contact": contact,
+            "category": category,
+            "groupId": group_id,
+        }
+
+        req = await self._send_json('POST', path, data)
+
+        return self._handle(req, _BAD_REQUEST_ERRORS)
+
+    async def update_device(self, device_id, name=None, unique_id=None, group_id=None,
+                            phone=None, model=None, contact=None, category=None):
+        """Path: /devices/{id}
+        Update a device. Only the given params are changed, see
+        TraccarAPI.update_device.
+
+        Returns:
+          json: Updated device.
+
+        Raises:
+          BadRequestException:
+
+        """
+        # Get current device values
+        data = (await self.get_devices(query='id', params=device_id))[0]
+
+        # Replaces all updated values
+        if name is not None:
+            data['name'] = name
+        if unique_id is not None:
+            data['uniqueId'] = unique_id
+        if phone is not None:
+            data['phone'] = phone
+        if model is not None:
+            data['model'] = model
+        if contact is not None:
+            data['contact'] = contact
+        if category is not None:
+            data['category'] = category
+        if group_id is not None:
+            data['groupId'] = group_id
+
+        req = await self._send_json('PUT', self._devices_prefix + str(device_id), data)
+
+        return self._handle(req, _BAD_REQUEST_ERRORS)
+
+    async def delete_device(self, device_id):
+        req = await self._request('DELETE', self._devices_prefix + str(device_id))
+
+        self._handle(req, {}, ok=204)
+
+    """
+    ----------------------
+    /api/geofences
+    ----------------------
+    """
+    async def get_all_geofences(self):
+        """Path: /geofences
+        Can only be used by admins or managers to fetch all entities.
+
+        Returns:
+          json: All geofences
+
+        """
+        path = self._urls['geofences']
+        data = {'all': True}
+        req = await self._request('GET', path, params=_query(data))
+
+        return self._handle(req, _PERMISSION_ERRORS)
+
+    async def get_geofences(self, query=None, params=None):
+        """
+        Path: /geofences
+        Fetch a list of geofences.
+        Without any params, returns a list of the user's geofences.
+
+        Args:
+          query: Fetch by: userId, deviceId, groupId, id (Default value = None)
+          params: identifier or identifiers list.
+            Examples: [5, 10], 'geoFenceId' (Default value = None)
+
+        Returns:
+          json: Geofence list
+
+        Raises:
+          ObjectNotFoundException:
+
+        """
+        path = self._urls['geofences']
+
+        if not query:
+            req = await self._request('GET', path)
+        else:
+            data = {query: params}
+            req = await self._request('GET', path, params=_query(data))
+
+        return self._handle(req, {400: lambda req: ObjectNotFoundException(obj=params, obj_type='Geofence')})
+
+    async def create_geofence(self, name, area, description='', calendarId=None, attributes=None):
+        """Path: /geofences
+        Create a geofence, see TraccarAPI.create_geofence.
+
+        Returns:
+          json: Created geofence.
+
+        Raises:
+          BadRequestException: If Geofence exists in database.
+
+        """
+        path = self._urls['geofences']
+
+        data = {
+            "id": -1,  # id auto-assignment
+            "name": name,
+            "description": description,
+            "area": str(area),
+        }
+
+        req = await self._send_json('POST', path, data)
+
+        return self._handle(req, _BAD_REQUEST_ERRORS)
+
+    async def update_geofence(self, geofence_id, name=None, area=None, description=None,
+                              calendarId=None, attributes=None):
+        """Path: /geofences/{id}
+        Update a geofence. Only the given params are changed, see
+        TraccarAPI.update_geofence.
+
+        Returns:
+          json: Updated geofence.
+
+        Raises:
+          BadRequestException:
+
+        """
+        # Get current geofence values
+        data = (await self.get_geofences(query='id', params=geofence_id))[0]
+
+        # Replaces all updated values
+        if name is not None:
+            data['name'] = name
+        if area is not None:
+            data['area'] = str(area)
+        if description is not None:
+            data['description'] = description
+        if calendarId is not None:
+            data['calendarId'] = calendarId
+        if attributes is not None:
+            data['attributes'] = attributes
+
+        req = await self._send_json('PUT', self._geofences_prefix + str(geofence_id), data)
+
+        return self._handle(req, _BAD_REQUEST_ERRORS)
+
+    async def delete_geofence(self, geofence_id):
+        req = await self._request('DELETE', self._geofences_prefix + str(geofence_id))
+
+        self._handle(req, {}, ok=204)
+
+    """
+    ----------------------
+    /api/notifications
+    ----------------------
+    """
+    async def get_all_notifications(self):
+        """Path: /notifications
+        Can only be used by admins or managers to fetch all entities
+
+        Returns:
+          json: list of Notifications
+
+        """
+        path = self._urls['notifications']
+        data = {'all': True}
+        req = await self._request('GET', path, params=_query(data))
+
+        return self._handle(req, _PERMISSION_ERRORS)
+
+    """
+    ----------------------
+    /api/reports/events
+    ----------------------
+    """
+    async def get_events(self, startTime, endTime, event_type=None, deviceid=None, groupId=None):
+        """Path: /events
+        Can only be used by users to fetch events
+
+        Returns:
+            json: list of Events
+        """
+        path = self._urls['reports_events']
+        data = {
+            'from': startTime,
+            'to': endTime,
+            'groupId': groupId or "1",
+            'type': event_type or "%",
+        }
+        req = await self._request('GET', path, params=_query(data))
+
+        return self._handle(req, _PERMISSION_ERRORS)
+
+    """
+    ----------------------
+    /api/positions
+    ----------------------
+    """
+    async def get_positions(self, deviceId=None, startTime=None, endTime=None, position_id=None):
+        """Path: /positions
+        Can only be used by users to fetch positions
+
+        Returns:
+            json: list of Positions
+        """
+        path = self._urls['positions']
+        data = {
+            'deviceId': deviceId,
+            'from': startTime,
+            'to': endTime,
+            'id': position_id,
+        }
+        req = await self._request('GET', path, params=_query(data))
+
+        return self._handle(req, _PERMISSION_ERRORS)
+
+    async def get_positions_bulk(self, device_ids, startTime=None, endTime=None):
+        """Fetches the positions of several devices concurrently.
+
+        Args:
+            device_ids: Device identifiers list
+            startTime: Start of the time window (Default value = None)
+            endTime: End of the time window (Default value = None)
+
+        Returns:
+            dict: Device id to list of Positions
+        """
+        results = await asyncio.gather(*[
+            self.get_positions(deviceId=device_id, startTime=startTime, endTime=endTime)
+            for device_id in device_ids])
+        return dict(zip(device_ids, results))
+
+    """
+    ----------------------
+    /api/reports/trips
+    ----------------------
+    """
+    async def get_trips(self, startTime, endTime, deviceid=None, groupId=None):
+        """Path: /trips
+        Can only be used by users to fetch events
+
+        Returns:
+            json: list of Report Trips
+        """
+        path = self._urls['reports_trips']
+        data = {
+            'from': startTime,
+            'to': endTime,
+            'groupId': groupId or "1",
+        }
+        req = await self._request('GET', path, params=_query(data), headers=_JSON_REPORT_HEADERS)
+
+        return self._handle(req, _PERMISSION_ERRORS)
+
+    """
+    ----------------------
+    /api/users
+    ----------------------
+    """
+    async def get_all_users(self):
+        """Path: /users
+        Can only be used by admins or managers to fetch all entities.
+
+        Returns:
+          json: All users
+        """
+        path = self._urls['users']
+        data = {'all': True}
+        req = await self._request('GET', path, params=_query(data))
+
+        return self._handle(req, _PERMISSION_ERRORS)
+
+    async def create_user(self, name, email, administrator=False, token=None):
+        """Path: /users
+        Create a user, see TraccarAPI.create_user.
+
+        Returns:
+          json: Created user.
+
+        Raises:
+          BadRequestException: If user exists in database.
+
+        """
+        path = self._urls['users']
+
+        data = {
+            "id": -1,  # id auto-assignment
+            "name": name,
+            "email": email,
+            "administrator": administrator,
+            "token": token,
+            "attributes": {"speedUnit": "kmh"},
+        }
+
+        req = await self._send_json('POST', path, data)
+
+        return self._handle(req, _BAD_REQUEST_ERRORS)
+
+    """
+    ----------------------
+    /api/permissions
+    ----------------------
+    """
+    async def set_permissions(self, userId, deviceId=0, groupId=0):
+        """Path: /permissions
+        Can only be used by admins to set permissions
+
+        Returns:
+            json: Permissions object
+        """
+        path = self._urls['permissions']
+
+        if deviceId:
+            data = {"userId": userId, "deviceId": deviceId}
+        elif groupId:
+            data = {"userId": userId, "groupId": groupId}
+        else:
+            raise ValueError("deviceId or groupId required")
+
+        req = await self._send_json('POST', path, data)
+
+        self._handle(req, _BAD_REQUEST_ERRORS, ok=204)
+        return data
+
+    async def set_permissions_bulk(self, userId, deviceIds=None, groupIds=None):
+        """Path: /permissions
+        Links several devices and/or groups to a user concurrently.
+
+        Args:
+            userId: User identifier
+            deviceIds: Devices identifiers list (Default value = None)
+            groupIds: Groups identifiers list (Default value = None)
+
+        Returns:
+            list: Permissions objects, devices first then groups
+        """
+        calls = [self.set_permissions(userId, deviceId=device_id) for device_id in deviceIds or ()]
+        calls += [self.set_permissions(userId, groupId=group_id) for group_id in groupIds or ()]
+        return list(await asyncio.gather(*calls))
+
+    """
+    ----------------------
+    /api/groups
+    ----------------------
+    """
+    async def get_groups(self, userId=None):
+        """
+        Path: /groups
+        Fetch a list of groups.
+        Without any params, returns a list of the user's groups.
+
+        Returns:
+            json: list of Groups
+        """
+        path = self._urls['groups']
+        data = {'userId': userId}
+        req = await self._request('GET', path, params=_query(data))
+
+        return self._handle(req, _PERMISSION_ERRORS)
+
+    """
+    ----------------------
+    /api/reports/route
+    ----------------------
+    """
+    async def get_route(self, deviceid, startTime, endTime):
+        """Path: /route
+        Can only be used by users to fetch route
+
+        Returns:
+            json: list of positions
+        """
+        path = self._urls['reports_route']
+        data = {
+            'deviceId': deviceid,
+            'from': startTime,
+            'to': endTime,
+        }
+        req = await self._request('GET', path, params=_query(data), headers=_JSON_REPORT_HEADERS)
+
+        return self._handle(req, _PERMISSION_ERRORS)
+
+    async def get_route_bulk(self, device_ids, startTime, endTime):
+        """Fetches the route of several devices concurrently.
+
+        Args:
+            device_ids: Device identifiers list
+            startTime: Start of the time window
+            endTime: End of the time window
+
+        Returns:
+            dict: Device id to list of positions
+        """
+        results = await asyncio.gather(*[
+            self.get_route(device_id, startTime, endTime) for device_id in device_ids])
+        return dict(zip(device_ids, results))
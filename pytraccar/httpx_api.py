@@ -0,0 +1,77 @@
+import httpx
+
+from pytraccar.api import TraccarAPI, _dumps, _JSON_HEADERS, ijson
+
+
+class TraccarAPIHttpx(TraccarAPI):
+    """Traccar v4.2 - https://www.traccar.org/api-reference/
+    TraccarAPI running on an httpx HTTP/2 client instead of requests.
+
+    Concurrent calls from several threads, e.g. set_permissions_bulk,
+    are multiplexed over a single connection. Requires httpx[http2].
+    HTTP/2 is only negotiated over https, plain http:// servers (e.g.
+    Traccar's default port 8082) are talked to over HTTP/1.1.
+
+    Takes the same arguments as TraccarAPI, except cookie_cache which is
+    not supported.
+
+    """
+
+    def _new_session(self):
+        """Creates the HTTP/2 client used by all the endpoints.
+
+        Like requests, it has no timeout and follows redirects, so long
+        report calls behave as with TraccarAPI.
+
+        Returns:
+            httpx.Client
+        """
+        if self._cookie_cache:
+            raise ValueError('TraccarAPIHttpx does not support cookie_cache')
+        self._client = httpx.Client(http2=True, timeout=None, follow_redirects=True,
+                                    limits=httpx.Limits(max_keepalive_connections=32))
+        return self._client
+
+    def close(self):
+        """Closes the underlying connections."""
+        self._client.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _send_all(self, name, headers=None):
+        return self._client.get(self._urls[name], params={'all': True}, headers=headers)
+
+    def _send_json(self, method, url, data):
+        return self._client.request(method, url, content=_dumps(data), headers=_JSON_HEADERS)
+
+    def _stream(self, url, headers=None):
+        req = self._client.send(self._client.build_request('GET', url, headers=headers), stream=True)
+        if req.status_code != 200:
+            req.read()  # Error bodies are small, load them for req.text
+        return req
+
+    @staticmethod
+    def _iter_items(req):
+        """Yields the elements of a streamed JSON array response one by one.
+
+        Args:
+            req: httpx.Response sent with stream=True
+
+        Returns:
+            generator: Decoded array elements
+        """
+        try:
+            items = ijson.sendable_list()
+            parser = ijson.items_coro(items, 'item', use_float=True)
+            for chunk in req.iter_bytes():
+                parser.send(chunk)
+                yield from items
+                del items[:]
+            parser.close()
+            yield from items
+        finally:
+            req.close()
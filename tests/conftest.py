@@ -0,0 +1,153 @@
+"""Local stub of a Traccar server for the client behaviour tests.
+
+Unlike test_api_calls.py these need no Traccar instance: a small HTTP
+server on 127.0.0.1 answers the endpoints each test registers.
+"""
+import json
+import sys
+import threading
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qs
+except ImportError:  # Python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qs
+
+import pytest
+
+import pytraccar.api as api
+
+# The async and httpx clients need Python 3.7+ (asyncio.run, async def)
+collect_ignore = []
+if sys.version_info < (3, 7):
+    collect_ignore.append('test_extra_clients.py')
+
+user_token = '12345678901234567890ABCDEFGHIJKL'
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    request_queue_size = 64  # Bulk calls open many connections at once
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self):
+        stub = self.server.stub
+        path, _, query = self.path.partition('?')
+        length = int(self.headers.get('Content-Length') or 0)
+        request = {
+            'method': self.command,
+            'path': path,
+            'query': parse_qs(query, keep_blank_values=True),
+            'headers': self.headers,
+            'body': self.rfile.read(length) if length else b'',
+        }
+        stub.requests.append(request)
+
+        route = stub.routes.get((self.command, path))
+        status, payload, headers = route(request) if route else (404, b'', {})
+        if not isinstance(payload, bytes):
+            payload = json.dumps(payload).encode('utf-8')
+
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _reply
+
+
+class StubTraccar(object):
+    """Answers the routes registered by a test, logging every request."""
+
+    def __init__(self):
+        self.requests = []
+        self.routes = {}
+        self.session_cookie = 'JSESSIONID=stub-session'
+        self._server = _ThreadingHTTPServer(('127.0.0.1', 0), _StubHandler)
+        self._server.stub = self
+        self.url = 'http://127.0.0.1:{}'.format(self._server.server_port)
+        threading.Thread(target=self._server.serve_forever).start()
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def route(self, method, path, handler):
+        """handler(request) returns (status, payload, headers)."""
+        self.routes[(method, path)] = handler
+
+    def reply(self, method, path, status=200, payload=b'', headers=None, auth=True):
+        """Registers a fixed answer, 401 without the session cookie if auth."""
+        def handler(request):
+            if auth and not self.logged_in(request):
+                return 401, b'', {}
+            return status, payload, headers or {}
+        self.route(method, path, handler)
+
+    def calls(self, method, path):
+        return [r for r in self.requests if (r['method'], r['path']) == (method, path)]
+
+    def logged_in(self, request):
+        return self.session_cookie in (request['headers'].get('Cookie') or '')
+
+    def credentials_session(self, request):
+        form = parse_qs(request['body'].decode('utf-8'))
+        if (form.get('email'), form.get('password')) == (['admin'], ['admin']):
+            return 200, {'id': 1, 'name': 'admin'}, {'Set-Cookie': self.session_cookie + '; Path=/'}
+        return 401, b'', {}
+
+    def token_session(self, request):
+        if request['query'].get('token') == [user_token]:
+            return 200, {'id': 1, 'name': 'user'}, {'Set-Cookie': self.session_cookie + '; Path=/'}
+        return 404, b'', {}
+
+
+@pytest.fixture
+def stub():
+    server = StubTraccar()
+    server.route('GET', '/api/session', server.token_session)
+    server.route('POST', '/api/session', server.credentials_session)
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def user(stub):
+    client = api.TraccarAPI(base_url=stub.url)
+    client.login_with_token(token=user_token)
+    return client
+
+
+@pytest.fixture
+def fake_devices(stub):
+    """Builds a FakeDevices store on the stub server."""
+    return lambda **device: FakeDevices(stub, **device)
+
+
+class FakeDevices(object):
+    """Server side device store: GET /api/devices?id= and PUT /api/devices/<id>."""
+
+    def __init__(self, stub, **device):
+        self.device = dict(device)
+        self.put_failures = []
+        stub.route('GET', '/api/devices', self.get)
+        stub.route('PUT', '/api/devices/{}'.format(device['id']), self.put)
+
+    def get(self, request):
+        return 200, [self.device], {}
+
+    def put(self, request):
+        if self.put_failures:
+            return self.put_failures.pop(0), b'conflict', {}
+        self.device = json.loads(request['body'].decode('utf-8'))
+        return 200, self.device, {}
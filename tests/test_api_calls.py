@@ -116,3 +116,9 @@ def test_api_users_with_admin(admin_session):
     admin = admin_session
     task1 = admin.get_all_devices()
     assert type(task1) == list
+
+
+def test_set_permissions_requires_target():
+    admin = api.TraccarAPI(base_url=test_url)
+    with pytest.raises(ValueError):
+        admin.set_permissions(userId=1)
@@ -0,0 +1,262 @@
+"""Client behaviour tests against the stub server of conftest.py."""
+import json
+import os
+import shutil
+
+import pytest
+
+from pytraccar.exceptions import (
+    TraccarApiException,
+    BadRequestException,
+    ObjectNotFoundException,
+    ForbiddenAccessException,
+    InvalidTokenException,
+    UserPermissionException
+)
+import pytraccar.api as api
+
+user_token = '12345678901234567890ABCDEFGHIJKL'
+
+
+def test_update_device_fetches_current_values_by_default(stub, user, fake_devices):
+    devices = fake_devices(id=5, name='a', phone='')
+    user.update_device(5, name='b')
+    devices.device['phone'] = 'EXTERNAL'  # Changed by another client
+
+    assert user.update_device(5, model='m')['phone'] == 'EXTERNAL'
+    assert len(stub.calls('GET', '/api/devices')) == 2
+
+
+def test_update_device_cache_retries_stale_entry(stub, fake_devices):
+    user = api.TraccarAPI(base_url=stub.url, cache_updates=True)
+    user.login_with_token(token=user_token)
+    devices = fake_devices(id=5, name='a')
+
+    user.update_device(5, name='b')
+    user.update_device('5', name='c')  # Cached under the same key
+    assert len(stub.calls('GET', '/api/devices')) == 1
+
+    # A 4xx on a PUT built from the cache refetches and retries once
+    devices.put_failures = [404]
+    assert user.update_device(5, name='d')['name'] == 'd'
+    assert len(stub.calls('GET', '/api/devices')) == 2
+    assert len(stub.calls('PUT', '/api/devices/5')) == 4
+
+    # Without a cached entry the error is raised, no retry
+    user._device_cache.clear()
+    devices.put_failures = [404]
+    with pytest.raises(TraccarApiException):
+        user.update_device(5, name='e')
+
+
+def test_iter_positions_streams_items(stub, user):
+    pytest.importorskip('ijson')
+    stub.reply('GET', '/api/positions', payload=[{'id': i, 'latitude': 1.5} for i in range(3)])
+
+    assert list(user.iter_positions(deviceId=1)) == [
+        {'id': i, 'latitude': 1.5} for i in range(3)]
+    assert stub.calls('GET', '/api/positions')[0]['query'] == {'deviceId': ['1']}
+
+    # Closing an unread iterator releases its connection
+    with user.iter_positions(deviceId=1) as positions:
+        pass
+    assert positions._req.raw.closed
+
+
+def test_set_permissions_bulk(stub, user):
+    stub.reply('POST', '/api/permissions', status=204)
+
+    result = user.set_permissions_bulk(userId=2, deviceIds=[1, 2, 3], groupIds=[4])
+    assert result == [{'userId': 2, 'deviceId': 1}, {'userId': 2, 'deviceId': 2},
+                      {'userId': 2, 'deviceId': 3}, {'userId': 2, 'groupId': 4}]
+    sent = [json.loads(r['body'].decode('utf-8')) for r in stub.calls('POST', '/api/permissions')]
+    assert sorted(p.get('deviceId', 0) for p in sent) == [0, 1, 2, 3]
+
+
+def test_login_reuses_cookie_cache(stub, tmp_path):
+    cache = str(tmp_path / 'session')
+    api.TraccarAPI(base_url=stub.url, cookie_cache=cache).login_with_token(token=user_token)
+    with open(cache, 'rb') as f:
+        assert user_token.encode('utf-8') not in f.read()
+
+    # The cached session is returned without contacting the server
+    user = api.TraccarAPI(base_url=stub.url, cookie_cache=cache)
+    assert user.login_with_token(token=user_token) == {'id': 1, 'name': 'user'}
+    assert user.token == user_token
+    assert len(stub.calls('GET', '/api/session')) == 1
+
+
+@pytest.mark.skipif(os.name != 'posix', reason='needs file modes and symlinks')
+def test_cookie_cache_file_is_private_json(stub, tmp_path):
+    cache = str(tmp_path / 'session')
+    with open(cache, 'w') as f:
+        f.write('planted')
+    os.chmod(cache, 0o644)
+
+    api.TraccarAPI(base_url=stub.url, cookie_cache=cache).login_with_token(token=user_token)
+    assert os.stat(cache).st_mode & 0o777 == 0o600
+    with open(cache) as f:
+        assert json.load(f)['cookies'][0]['value'] == 'stub-session'
+
+    # A symlink is neither written through nor read
+    target = str(tmp_path / 'target')
+    with open(target, 'w') as f:
+        f.write('untouched')
+    link = str(tmp_path / 'link')
+    os.symlink(target, link)
+    user = api.TraccarAPI(base_url=stub.url, cookie_cache=link)
+    user.login_with_token(token=user_token)
+    with open(target) as f:
+        assert f.read() == 'untouched'
+    shutil.copy(cache, target)  # A valid cache behind the symlink
+    assert api.TraccarAPI(base_url=stub.url, cookie_cache=link)._cached_login is None
+
+
+def test_cookie_cache_checks_password(stub, tmp_path):
+    cache = str(tmp_path / 'session')
+    api.TraccarAPI(base_url=stub.url, cookie_cache=cache).login_with_credentials('admin', 'admin')
+    with open(cache, 'rb') as f:
+        assert b'admin\nadmin' not in f.read()
+
+    admin = api.TraccarAPI(base_url=stub.url, cookie_cache=cache)
+    with pytest.raises(ForbiddenAccessException):
+        admin.login_with_credentials('admin', 'WRONG')
+    assert len(stub.calls('POST', '/api/session')) == 2
+
+    admin = api.TraccarAPI(base_url=stub.url, cookie_cache=cache)
+    assert admin.login_with_credentials('admin', 'admin') == {'id': 1, 'name': 'admin'}
+    assert len(stub.calls('POST', '/api/session')) == 2
+
+
+def test_expired_cookie_cache_logs_in_once(stub, tmp_path):
+    cache = str(tmp_path / 'session')
+    api.TraccarAPI(base_url=stub.url, cookie_cache=cache).login_with_token(token=user_token)
+
+    # A new run reuses the persisted session, then the server expires it
+    user = api.TraccarAPI(base_url=stub.url, cookie_cache=cache)
+    user.login_with_token(token=user_token)
+    assert len(stub.calls('GET', '/api/session')) == 1
+    stub.session_cookie = 'JSESSIONID=renewed'
+    stub.reply('POST', '/api/permissions', status=204)
+
+    assert len(user.set_permissions_bulk(userId=2, deviceIds=list(range(1, 17)))) == 16
+    assert len(stub.calls('GET', '/api/session')) == 2
+
+
+def test_fresh_login_ignores_other_cached_session(stub, tmp_path):
+    cache = str(tmp_path / 'session')
+    api.TraccarAPI(base_url=stub.url, cookie_cache=cache).login_with_token(token=user_token)
+
+    # Logs in with credentials, so the cached token session is not used
+    admin = api.TraccarAPI(base_url=stub.url, cookie_cache=cache)
+    admin.login_with_credentials('admin', 'admin')
+    stub.session_cookie = 'JSESSIONID=renewed'
+    stub.reply('GET', '/api/groups', payload=[])
+
+    # Same as without a cache file: an expired session is not renewed
+    with pytest.raises(TraccarApiException):
+        admin.get_groups()
+    assert len(stub.calls('POST', '/api/session')) == 1
+
+
+def test_get_all_uses_session_settings(stub, user, monkeypatch):
+    stub.reply('GET', '/api/devices', payload=[{'id': 1}])
+    monkeypatch.setenv('REQUESTS_CA_BUNDLE', '/path/to/ca.pem')
+
+    sent = []
+    send = user._session.send
+    monkeypatch.setattr(user._session, 'send', lambda prep, **kwargs: sent.append(kwargs) or send(prep, **kwargs))
+
+    assert user.get_all_devices() == [{'id': 1}]
+    assert sent[0]['verify'] == '/path/to/ca.pem'
+
+
+def test_get_all_revalidates_with_etag(stub, user):
+    def devices(request):
+        if request['headers'].get('If-None-Match') == '"v1"':
+            return 304, b'', {}
+        return 200, [{'id': 1}], {'ETag': '"v1"'}
+    stub.route('GET', '/api/devices', devices)
+
+    first = user.get_all_devices()
+    first.append({'id': 2})  # Callers get their own copy
+    assert user.get_all_devices() == [{'id': 1}]
+
+    calls = stub.calls('GET', '/api/devices')
+    assert [c['headers'].get('If-None-Match') for c in calls] == [None, '"v1"']
+
+
+def test_gateway_errors_are_retried(stub, user):
+    replies = [503, 502, 504, 200]
+
+    def positions(request):
+        return replies.pop(0), [{'id': 1}], {}
+    stub.route('GET', '/api/positions', positions)
+
+    assert user.get_positions(deviceId=1) == [{'id': 1}]
+    assert len(stub.calls('GET', '/api/positions')) == 4
+
+    # Once retries run out the last reply is raised, not a urllib3 error
+    stub.reply('GET', '/api/positions', status=503, payload=b'unavailable')
+    with pytest.raises(TraccarApiException) as exc:
+        user.get_positions(deviceId=1)
+    assert 'unavailable' in str(exc.value)
+    assert len(stub.calls('GET', '/api/positions')) == 8
+
+
+@pytest.mark.parametrize('method, path, call, status, expected', [
+    ('GET', '/api/devices', lambda user: user.get_all_devices(), 400, UserPermissionException),
+    ('GET', '/api/devices', lambda user: user.get_devices(query='id', params=9), 400,
+     ObjectNotFoundException),
+    ('POST', '/api/devices', lambda user: user.create_device('a', 'b'), 400, BadRequestException),
+    ('GET', '/api/groups', lambda user: user.get_groups(), 500, TraccarApiException),
+])
+def test_error_statuses_raise(stub, user, method, path, call, status, expected):
+    stub.reply(method, path, status=status, payload=b'server says no')
+    with pytest.raises(TraccarApiException) as exc:
+        call(user)
+    assert type(exc.value) is expected
+    if expected in (BadRequestException, TraccarApiException):
+        assert 'server says no' in str(exc.value)
+
+
+def test_login_errors_raise(stub):
+    with pytest.raises(ForbiddenAccessException):
+        api.TraccarAPI(base_url=stub.url).login_with_credentials('admin', 'WRONG')
+    with pytest.raises(InvalidTokenException):
+        api.TraccarAPI(base_url=stub.url).login_with_token(token='WRONG')
+
+
+def test_query_strings_sent(stub, user):
+    for path in ('/api/positions', '/api/reports/events', '/api/reports/route', '/api/groups'):
+        stub.reply('GET', path, payload=[])
+
+    user.get_positions(deviceId=1)
+    user.get_positions(position_id=[1, 2])
+    user.get_events('2019-01-01T00:00:00Z', '2019-01-02T00:00:00Z')
+    user.get_route(3, 'a', 'b')
+    user.get_groups()
+    assert [c['query'] for c in stub.calls('GET', '/api/positions')] == [
+        {'deviceId': ['1']}, {'id': ['1', '2']}]
+    assert stub.calls('GET', '/api/reports/events')[0]['query'] == {
+        'from': ['2019-01-01T00:00:00Z'], 'to': ['2019-01-02T00:00:00Z'],
+        'groupId': ['1'], 'type': ['%']}
+    assert stub.calls('GET', '/api/reports/route')[0]['query'] == {
+        'deviceId': ['3'], 'from': ['a'], 'to': ['b']}
+    assert stub.calls('GET', '/api/groups')[0]['query'] == {}
+
+
+def test_json_bodies_use_the_module_codec(stub, user, monkeypatch):
+    encoded = []
+    dumps = api._dumps
+    monkeypatch.setattr(api, '_dumps', lambda obj: encoded.append(obj) or dumps(obj))
+    for path in ('/api/devices', '/api/users'):
+        stub.reply('POST', path, payload={'id': 1})
+    stub.reply('POST', '/api/permissions', status=204)
+
+    user.create_device('a', 'b')
+    user.create_user('c', 'd')
+    user.set_permissions(userId=1, deviceId=2)
+    assert [obj['name'] for obj in encoded[:2]] == ['a', 'c']
+    assert encoded[2] == {'userId': 1, 'deviceId': 2}
+    assert stub.calls('POST', '/api/devices')[0]['headers']['Content-Type'] == 'application/json'
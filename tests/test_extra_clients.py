@@ -0,0 +1,113 @@
+"""Stub server tests of the AsyncTraccarAPI and TraccarAPIHttpx clients.
+
+Python 3.7+ only, conftest.py skips this module on older versions.
+"""
+import asyncio
+
+import pytest
+
+from pytraccar.exceptions import (
+    TraccarApiException,
+    BadRequestException,
+    ForbiddenAccessException
+)
+
+user_token = '12345678901234567890ABCDEFGHIJKL'
+
+
+def test_async_login_then_call(stub):
+    async_api = pytest.importorskip('pytraccar.async_api')
+    stub.reply('GET', '/api/devices', payload=[{'id': 1}])
+
+    async def run():
+        async with async_api.AsyncTraccarAPI(base_url=stub.url) as client:
+            await client.login_with_token(token=user_token)
+            return await client.get_devices()
+
+    assert asyncio.run(run()) == [{'id': 1}]
+
+
+def test_async_bulk_positions(stub):
+    async_api = pytest.importorskip('pytraccar.async_api')
+
+    def positions(request):
+        if not stub.logged_in(request):
+            return 401, b'', {}
+        return 200, [{'deviceId': int(request['query']['deviceId'][0])}], {}
+    stub.route('GET', '/api/positions', positions)
+
+    async def run():
+        async with async_api.AsyncTraccarAPI(base_url=stub.url) as client:
+            await client.login_with_token(token=user_token)
+            return await client.get_positions_bulk([1, 2])
+
+    assert asyncio.run(run()) == {1: [{'deviceId': 1}], 2: [{'deviceId': 2}]}
+
+    # Unexpected statuses raise like the sync client
+    stub.reply('GET', '/api/positions', status=500, payload=b'oops')
+    with pytest.raises(TraccarApiException):
+        asyncio.run(run())
+
+
+def test_async_delete_device(stub):
+    async_api = pytest.importorskip('pytraccar.async_api')
+    stub.reply('DELETE', '/api/devices/7', status=204)
+
+    async def run():
+        async with async_api.AsyncTraccarAPI(base_url=stub.url) as client:
+            await client.login_with_token(token=user_token)
+            await client.delete_device(7)
+
+    asyncio.run(run())
+    assert len(stub.calls('DELETE', '/api/devices/7')) == 1
+
+
+def test_async_error_statuses_raise(stub):
+    async_api = pytest.importorskip('pytraccar.async_api')
+    stub.reply('POST', '/api/devices', status=400, payload=b'duplicate')
+
+    async def run(password):
+        async with async_api.AsyncTraccarAPI(base_url=stub.url) as client:
+            await client.login_with_credentials('admin', password)
+            await client.create_device('a', 'b')
+
+    with pytest.raises(ForbiddenAccessException):
+        asyncio.run(run('WRONG'))
+    with pytest.raises(BadRequestException) as exc:
+        asyncio.run(run('admin'))
+    assert 'duplicate' in str(exc.value)
+
+
+def test_async_update_device(stub, fake_devices):
+    async_api = pytest.importorskip('pytraccar.async_api')
+    devices = fake_devices(id=5, name='a', phone='123')
+
+    async def run():
+        async with async_api.AsyncTraccarAPI(base_url=stub.url) as client:
+            await client.login_with_token(token=user_token)
+            return await client.update_device(5, name='b')
+
+    assert asyncio.run(run()) == {'id': 5, 'name': 'b', 'phone': '123'}
+    assert devices.device == {'id': 5, 'name': 'b', 'phone': '123'}
+    assert stub.calls('GET', '/api/devices')[0]['query'] == {'id': ['5']}
+
+
+def test_httpx_client(stub, fake_devices):
+    httpx_api = pytest.importorskip('pytraccar.httpx_api')
+    pytest.importorskip('h2')
+    pytest.importorskip('ijson')
+    stub.reply('GET', '/api/positions', payload=[{'id': 1}, {'id': 2}])
+    devices = fake_devices(id=5, name='a')
+
+    with httpx_api.TraccarAPIHttpx(base_url=stub.url) as user:
+        assert user._client.timeout.read is None
+        user.login_with_token(token=user_token)
+        assert user.get_all_devices() == [{'id': 5, 'name': 'a'}]
+        assert user.update_device(5, name='b')['name'] == 'b'
+        assert devices.device['name'] == 'b'
+        assert list(user.iter_positions(deviceId=1)) == [{'id': 1}, {'id': 2}]
+        with pytest.raises(TraccarApiException):
+            user.get_groups()  # Not routed, answered with 404
+
+    with pytest.raises(ValueError):
+        httpx_api.TraccarAPIHttpx(base_url=stub.url, cookie_cache='session')